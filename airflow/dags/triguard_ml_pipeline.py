@@ -25,17 +25,27 @@ default_args = {
 def load_and_split_data(**context):
     """Load data from CSV files and perform train/test split"""
     import pandas as pd
+    import polars as pl
 
     print("Loading data from CSV files...")
     csv_path = "/opt/airflow/data/tri_guard_5_py_clean"
 
+    def read_csv(path):
+        # Polars' multithreaded parser, handed back to the pandas code below.
+        # Full-file schema inference to match pd.read_csv dtypes.
+        return (
+            pl.scan_csv(path, infer_schema_length=None)
+            .collect(engine="streaming")
+            .to_pandas()
+        )
+
     # Load CSV files
     print("Loading individual CSV files...")
-    accident_df = pd.read_csv(f"{csv_path}/Accident.csv")
-    claim_df = pd.read_csv(f"{csv_path}/Claim.csv")
-    driver_df = pd.read_csv(f"{csv_path}/Driver.csv")
-    policyholder_df = pd.read_csv(f"{csv_path}/Policyholder.csv")
-    vehicle_df = pd.read_csv(f"{csv_path}/Vehicle.csv")
+    accident_df = read_csv(f"{csv_path}/Accident.csv")
+    claim_df = read_csv(f"{csv_path}/Claim.csv")
+    driver_df = read_csv(f"{csv_path}/Driver.csv")
+    policyholder_df = read_csv(f"{csv_path}/Policyholder.csv")
+    vehicle_df = read_csv(f"{csv_path}/Vehicle.csv")
 
     print(
         f"Loaded tables: Accident ({len(accident_df)}), Claim ({len(claim_df)}), "
@@ -10,15 +10,22 @@ def load_csv(path: str) -> pl.DataFrame:
 
 
 # Helper
+BOOL_MAP = {
+    "y": 1,
+    "yes": 1,
+    "true": 1,
+    "1": 1,
+    "n": 0,
+    "no": 0,
+    "false": 0,
+    "0": 0,
+}
+
+
 def to_bool(col: pl.Expr) -> pl.Expr:
+    # One hash lookup per row instead of two is_in scans plus a when-chain
     s = col.cast(pl.Utf8, strict=False).str.strip_chars().str.to_lowercase()
-    return (
-        pl.when(s.is_in(["y", "yes", "true", "1"]))
-        .then(pl.lit(1))
-        .when(s.is_in(["n", "no", "false", "0"]))
-        .then(pl.lit(0))
-        .otherwise(None)
-    )
+    return s.replace_strict(BOOL_MAP, default=None, return_dtype=pl.Int8)
 
 
 # Clean claim
@@ -105,9 +105,13 @@ def comprehensive_subrogation(
     """Create a comprehensive view of subrogation priority."""
     df = (
         accident.join(claim, on="accident_key", how="inner")
-        .group_by(["accident_key", "accident_site", "accident_type"])
+        # site/type are attributes of accident_key, so group on the integer key
+        # alone and carry them along instead of hashing all three columns
+        .group_by("accident_key")
         .agg(
             [
+                pl.col("accident_site").first(),
+                pl.col("accident_type").first(),
                 pl.len().alias("claim_count"),
                 pl.col("witness_present_ind").eq("Yes").sum().alias("witness_count"),
                 pl.col("policy_report_filed_ind")
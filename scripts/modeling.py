@@ -7,7 +7,11 @@ an F1-weighted ensemble of LightGBM, XGBoost, and CatBoost models to predict
 subrogation.
 """
 
+import hashlib
+import inspect
+import json
 import os
+from pathlib import Path
 
 import lightgbm as lgb
 import numpy as np
@@ -15,21 +19,19 @@ import optuna
 import pandas as pd
 import xgboost as xgb
 from catboost import CatBoostClassifier
-from imblearn.over_sampling import SMOTE
+from joblib import Parallel, delayed
 from sklearn.metrics import f1_score, roc_auc_score
 from sklearn.model_selection import StratifiedKFold
-from sklearn.preprocessing import LabelEncoder
 from sqlalchemy import create_engine, text
 
 # Load Data
 
 
-def load_data():
+def get_engine():
     """
-    Loads data from PostgreSQL database tables in 'stg' schema and merges them.
+    Creates the SQLAlchemy engine for Postgres from the PG* environment variables.
     """
-    print("Connecting to database...")
-    # 1. Read DB connection info from environment variables
+    # Read DB connection info from environment variables
     PGHOST = os.getenv("PGHOST")
     PGPORT = os.getenv("PGPORT", "5432")
     PGDB = os.getenv("PGDATABASE")
@@ -37,11 +39,19 @@ def load_data():
     PGPASS = os.getenv("PGPASSWORD")
     PGSSL = os.getenv("PGSSLMODE", "require")
 
-    # 2. Create SQLAlchemy engine for Postgres
     engine_url = f"postgresql+psycopg2://{PGUSER}:{PGPASS}@{PGHOST}:{PGPORT}/{PGDB}"
     if PGSSL:
         engine_url += f"?sslmode={PGSSL}"
-    engine = create_engine(engine_url)
+    return create_engine(engine_url)
+
+
+def load_data():
+    """
+    Loads data from PostgreSQL database tables in 'stg' schema and merges them.
+    """
+    print("Connecting to database...")
+    # 1-2. Create SQLAlchemy engine for Postgres
+    engine = get_engine()
 
     # 3. Test connection and fetch table names from schema `stg`
     with engine.begin() as con:
@@ -338,15 +348,11 @@ def create_enhanced_features_v2(df, artifacts=None):
         df[col] = df[col].fillna("Unknown").astype(str)
 
     df["accident_combo"] = df["accident_site"] + "_" + df["accident_type"]
-    df["zip_code"] = (
-        pd.to_numeric(df["zip_code"], errors="coerce")
-        .fillna(0)
-        .astype(int)
-        .astype(str)
-        .str.zfill(5)
-    )
-    df["zip3"] = df["zip_code"].str[:3]
-    df["zip3"] = df["zip3"].where(df["zip3"] != "000", "unknown")
+    # zip3 is the leading 3 digits of a 5-digit zip, i.e. zip // 100, kept
+    # zero-padded ("021") to match the labels the Airflow DAG produces
+    z = pd.to_numeric(df["zip_code"], errors="coerce").fillna(0).astype(np.int32)
+    df["zip_code"] = z
+    df["zip3"] = (z // 100).astype(str).str.zfill(3).where(z >= 100, "unknown")
 
     if is_training:
         return df, artifacts
@@ -354,12 +360,106 @@ def create_enhanced_features_v2(df, artifacts=None):
         return df
 
 
+# Feature Cache
+# Merged + engineered frames do not depend on HPO/model params, so they are
+# cached as Parquet and reused until the stg data, loading, split or FE code
+# changes. Set USE_FEATURE_CACHE=0 to always rebuild (and not write) them.
+CACHE_DIR = Path(".cache")
+USE_FEATURE_CACHE = os.getenv("USE_FEATURE_CACHE", "1") == "1"
+
+STG_TABLES = ["accident", "claim", "driver", "policyholder", "vehicle"]
+
+
+def data_fingerprint():
+    """
+    Cheap fingerprint of the stg tables (row counts and latest claim_date),
+    fetched in one query so a DB reload changes the cache key.
+    """
+    counts = ", ".join(f'(SELECT count(*) FROM stg."{t}")' for t in STG_TABLES)
+    query = f'SELECT {counts}, (SELECT max(claim_date) FROM stg."claim")'
+    with get_engine().connect() as con:
+        row = con.execute(text(query)).fetchone()
+    return repr(tuple(row))
+
+
+def feature_cache_key(fingerprint=""):
+    """
+    Build a cache key from the source of the data loading, split and FE
+    functions, the selected feature list and the data fingerprint.
+    """
+    src = "".join(
+        inspect.getsource(fn)
+        for fn in (load_data, prepare_features, create_enhanced_features_v2)
+    )
+    src += repr(SELECTED_FEATURES) + fingerprint
+    return hashlib.blake2b(src.encode(), digest_size=8).hexdigest()
+
+
+def _write_atomic(path, write):
+    # Write next to the target and rename, so an interrupted run never
+    # leaves a partial file under the cache name
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def save_feature_cache(key, X, y, X_test, test_ids, artifacts, cache_dir=CACHE_DIR):
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    train = X.assign(subrogation=y.values)
+    test = X_test.assign(claim_number=test_ids.values)
+    artifacts_json = json.dumps({k: float(v) for k, v in artifacts.items()})
+    _write_atomic(
+        cache_dir / f"train_{key}.parquet",
+        lambda p: train.to_parquet(p, compression="zstd", engine="pyarrow"),
+    )
+    _write_atomic(
+        cache_dir / f"test_{key}.parquet",
+        lambda p: test.to_parquet(p, compression="zstd", engine="pyarrow"),
+    )
+    _write_atomic(
+        cache_dir / f"artifacts_{key}.json",
+        lambda p: p.write_text(artifacts_json),
+    )
+
+
+def load_feature_cache(key, cache_dir=CACHE_DIR):
+    """
+    Returns (X, y, X_test, test_ids, artifacts), or None on a cache miss.
+    """
+    cache_dir = Path(cache_dir)
+    paths = [
+        cache_dir / f"train_{key}.parquet",
+        cache_dir / f"test_{key}.parquet",
+        cache_dir / f"artifacts_{key}.json",
+    ]
+    if not all(p.exists() for p in paths):
+        return None
+
+    X = pd.read_parquet(paths[0])
+    X_test = pd.read_parquet(paths[1])
+    y = X.pop("subrogation").astype(int)
+    test_ids = X_test.pop("claim_number")
+    with open(paths[2]) as f:
+        artifacts = json.load(f)
+
+    return X, y, X_test, test_ids, artifacts
+
+
 # Target Encoding Function
 def target_encode(X_train, y_train, X_val, X_test, cols, smoothing=30):
     global_mean = y_train.mean()
     te_names = []
 
     for col in cols:
+        if isinstance(X_train[col].dtype, pd.CategoricalDtype):
+            te_names.append(
+                _target_encode_codes(
+                    X_train, y_train, X_val, X_test, col, smoothing, global_mean
+                )
+            )
+            continue
         agg = (
             pd.DataFrame({col: X_train[col], "y": y_train})
             .groupby(col)["y"]
@@ -378,6 +478,101 @@ def target_encode(X_train, y_train, X_val, X_test, cols, smoothing=30):
     return te_names
 
 
+def _target_encode_codes(X_train, y_train, X_val, X_test, col, smoothing, global_mean):
+    """
+    Categorical column: per-category sums/counts via bincount on the codes,
+    then a plain take per frame. Unseen or missing categories get the global mean.
+    """
+    categories = X_train[col].cat.categories
+    codes = X_train[col].cat.codes.to_numpy()
+    seen = codes >= 0
+    y = np.asarray(y_train, dtype=np.float64)
+    sums = np.bincount(codes[seen], weights=y[seen], minlength=len(categories))
+    counts = np.bincount(codes[seen], minlength=len(categories))
+    means = np.where(
+        counts > 0, (sums + smoothing * global_mean) / (counts + smoothing), global_mean
+    )
+
+    # Code -1 (missing/unseen) takes the appended global mean; this also
+    # covers a categorical with no categories at all
+    lookup = np.append(means, global_mean)
+
+    te_col = f"{col}_te"
+    for X in (X_train, X_val, X_test):
+        s = X[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) and s.cat.categories.equals(
+            categories
+        ):
+            c = s.cat.codes.to_numpy()
+        else:
+            c = categories.get_indexer(s)
+        X[te_col] = lookup[c]
+    return te_col
+
+
+# Class Imbalance Weight
+def positive_class_weight(y, sampling_strategy=0.5):
+    """
+    Positive-class weight equivalent to SMOTE(sampling_strategy=...) oversampling,
+    passed to the GBDTs instead of resampling every fold.
+    """
+    n_pos = int((y == 1).sum())
+    n_neg = int((y == 0).sum())
+    return n_neg / max(1, n_pos) * sampling_strategy
+
+
+# GPU Acceleration
+# Set USE_GPU=1 to train the GBDTs on CUDA device 0 (requires GPU builds).
+USE_GPU = os.getenv("USE_GPU", "0") == "1"
+
+
+def gpu_params(kind):
+    """
+    Device kwargs for 'lgbm', 'xgb' or 'cat'; empty when USE_GPU is off.
+    """
+    if not USE_GPU:
+        return {}
+    if kind == "lgbm":
+        return {"device_type": "gpu"}
+    if kind == "xgb":
+        return {"tree_method": "hist", "device": "cuda"}
+    if kind == "cat":
+        return {"task_type": "GPU", "devices": "0", "border_count": 128}
+    raise ValueError(f"Unknown model kind: {kind}")
+
+
+def model_input(data):
+    """
+    Convert a fold matrix (DataFrame or array) into the contiguous array the
+    models are fit on. On GPU use float32 to avoid a host-side copy on every
+    fit/predict.
+    """
+    dtype = np.float32 if USE_GPU else np.float64
+    return np.ascontiguousarray(np.asarray(data, dtype=dtype))
+
+
+# Categorical Codes
+def category_indexes(frames, cols):
+    """
+    Build one sorted category index per object column across all frames.
+    Computed once and reused by every fold instead of refitting a
+    LabelEncoder per fold.
+    """
+    return {
+        col: pd.Index(pd.concat([f[col] for f in frames]).unique()).sort_values()
+        for col in cols
+        if frames[0][col].dtype == "object"
+    }
+
+
+def encode_categories(df, global_cats):
+    """
+    Replace object columns with their int32 codes in place.
+    """
+    for col, cats in global_cats.items():
+        df[col] = cats.get_indexer(df[col]).astype(np.int32)
+
+
 # Selected Features
 # Use SHAP-selected features from a previous run
 SELECTED_FEATURES = [
@@ -477,6 +672,9 @@ SELECTED_FEATURES = [
     "is_summer",
 ]
 
+# For membership checks, so callers don't rebuild a set from the list
+SELECTED_FEATURES_SET = frozenset(SELECTED_FEATURES)
+
 
 # CatBoost-Specific HPO: Optuna HPO Function
 def optimize_catboost_hyperparameters(
@@ -490,6 +688,10 @@ def optimize_catboost_hyperparameters(
     cat_features = [f for f in cat_features if f in X.columns]
     te_features = [f for f in te_features if f in X.columns]
 
+    global_cats = category_indexes(
+        [X], [f for f in selected_features + cat_features if f in X.columns]
+    )
+
     def objective(trial):
         params = {
             "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.05, log=True),
@@ -509,7 +711,8 @@ def optimize_catboost_hyperparameters(
             y_tr = y.iloc[train_idx]
             y_va = y.iloc[val_idx]
 
-            X_te_dummy = X_va.copy()  # Create dummy test for target encoding
+            # Dummy test for target encoding (only the encoded columns)
+            X_te_dummy = X_va[te_features].copy()
 
             te_names = target_encode(
                 X_tr, y_tr, X_va, X_te_dummy, te_features, smoothing=30
@@ -518,29 +721,30 @@ def optimize_catboost_hyperparameters(
             features = [f for f in features if f in X_tr.columns]
 
             # Label Encode any remaining object types
-            for col in features:
-                if X_tr[col].dtype == "object":
-                    le = LabelEncoder()
-                    all_vals = pd.concat([X_tr[col], X_va[col]]).unique()
-                    le.fit(all_vals)
-                    X_tr[col] = le.transform(X_tr[col])
-                    X_va[col] = le.transform(X_va[col])
+            encode_categories(X_tr, global_cats)
+            encode_categories(X_va, global_cats)
 
-            smote = SMOTE(sampling_strategy=0.5, random_state=42)
-            X_tr_res, y_tr_res = smote.fit_resample(X_tr[features], y_tr)
+            spw = positive_class_weight(y_tr)
+            X_tr_f = model_input(X_tr[features])
+            X_va_f = model_input(X_va[features])
 
             model = CatBoostClassifier(
-                iterations=1000, random_state=42, verbose=0, **params
+                iterations=1000,
+                random_state=42,
+                verbose=0,
+                class_weights=[1.0, spw],
+                **gpu_params("cat"),
+                **params,
             )
             model.fit(
-                X_tr_res,
-                y_tr_res,
-                eval_set=(X_va[features], y_va),
+                X_tr_f,
+                y_tr,
+                eval_set=(X_va_f, y_va),
                 early_stopping_rounds=100,
                 verbose=False,
             )
 
-            probs = model.predict_proba(X_va[features])[:, 1]
+            probs = model.predict_proba(X_va_f)[:, 1]
 
             # Find best F1 threshold
             best_f1 = 0
@@ -567,6 +771,89 @@ def optimize_catboost_hyperparameters(
     return study.best_params
 
 
+# Ensemble Base Models
+def _fit_predict(
+    kind, X_tr, y_tr, X_va, y_va, X_te, spw, seed, lgbm_params, catboost_params
+):
+    """
+    Fit one base model ('lgbm', 'xgb' or 'cat') on a fold and return
+    (val_probs, test_probs). Threads are capped so the three models can
+    run side by side without oversubscribing the CPU.
+    """
+    n_threads = max(1, (os.cpu_count() or 1) // 3)
+
+    if kind == "lgbm":
+        # Model 1: LightGBM
+        model = lgb.LGBMClassifier(
+            n_estimators=2000,
+            random_state=seed,
+            n_jobs=n_threads,
+            verbose=-1,
+            scale_pos_weight=spw,
+            **gpu_params("lgbm"),
+            **lgbm_params,
+        )
+        model.fit(
+            X_tr,
+            y_tr,
+            eval_set=[(X_va, y_va)],
+            callbacks=[lgb.early_stopping(150, verbose=False)],
+        )
+    elif kind == "xgb":
+        # Model 2: XGBoost
+        # Native API: bin the fold once into a QuantileDMatrix and reuse its
+        # cuts for the eval set; predict in place without building a DMatrix.
+        dtrain = xgb.QuantileDMatrix(X_tr, y_tr, max_bin=256)
+        dval = xgb.QuantileDMatrix(X_va, y_va, ref=dtrain)
+        params = {
+            "objective": "binary:logistic",
+            "eval_metric": "logloss",
+            "tree_method": "hist",
+            "max_bin": 256,
+            "grow_policy": "lossguide",
+            "learning_rate": lgbm_params["learning_rate"],
+            "max_depth": lgbm_params["max_depth"],
+            "subsample": lgbm_params["subsample"],
+            "colsample_bytree": lgbm_params["colsample_bytree"],
+            "reg_alpha": lgbm_params["reg_alpha"],
+            "reg_lambda": lgbm_params["reg_lambda"],
+            "scale_pos_weight": spw,
+            "seed": seed,
+            "nthread": n_threads,
+            **gpu_params("xgb"),
+        }
+        booster = xgb.train(
+            params,
+            dtrain,
+            num_boost_round=2000,
+            evals=[(dval, "val")],
+            verbose_eval=False,
+        )
+        return booster.inplace_predict(X_va), booster.inplace_predict(X_te)
+    elif kind == "cat":
+        # Model 3: CatBoost (with optimized params)
+        model = CatBoostClassifier(
+            iterations=2000,
+            random_state=seed,
+            verbose=0,
+            thread_count=n_threads,
+            class_weights=[1.0, spw],
+            **gpu_params("cat"),
+            **catboost_params,
+        )
+        model.fit(
+            X_tr,
+            y_tr,
+            eval_set=(X_va, y_va),
+            early_stopping_rounds=150,
+            verbose=False,
+        )
+    else:
+        raise ValueError(f"Unknown model kind: {kind}")
+
+    return model.predict_proba(X_va)[:, 1], model.predict_proba(X_te)[:, 1]
+
+
 # F1-Weighted Ensemble
 def train_weighted_ensemble(
     X, y, X_test, selected_features, lgbm_params, catboost_params, n_splits=5
@@ -583,6 +870,16 @@ def train_weighted_ensemble(
     cat_features = [f for f in cat_features if f in X.columns]
     te_features = [f for f in te_features if f in X.columns]
 
+    # Base features are fold-invariant: encode the test frame once here
+    # instead of copying the full X_test in every fold.
+    base_features = list(dict.fromkeys(selected_features + cat_features))
+    base_features = [f for f in base_features if f in X.columns]
+
+    global_cats = category_indexes([X, X_test], base_features)
+    X_te_base = X_test[base_features].copy()
+    encode_categories(X_te_base, global_cats)
+    X_te_base = X_te_base.to_numpy()
+
     skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
 
     oof_lgbm = np.zeros(len(X))
@@ -598,76 +895,48 @@ def train_weighted_ensemble(
 
         X_tr = X.iloc[train_idx].copy()
         X_va = X.iloc[val_idx].copy()
-        X_te = X_test.copy()
+        X_te_cols = X_test[te_features].copy()  # only the columns to encode
         y_tr = y.iloc[train_idx]
         y_va = y.iloc[val_idx]
 
-        te_names = target_encode(X_tr, y_tr, X_va, X_te, te_features, smoothing=30)
-        features = list(set(selected_features + cat_features + te_names))
-        features = [f for f in features if f in X_tr.columns]
+        te_names = target_encode(X_tr, y_tr, X_va, X_te_cols, te_features, smoothing=30)
+        features = base_features + te_names
 
         # Label Encode any remaining object types
-        for col in features:
-            if X_tr[col].dtype == "object":
-                le = LabelEncoder()
-                all_vals = pd.concat([X_tr[col], X_va[col], X_te[col]]).unique()
-                le.fit(all_vals)
-                X_tr[col] = le.transform(X_tr[col])
-                X_va[col] = le.transform(X_va[col])
-                X_te[col] = le.transform(X_te[col])
-
-        smote = SMOTE(sampling_strategy=0.5, random_state=42 + fold)
-        X_tr_res, y_tr_res = smote.fit_resample(X_tr[features], y_tr)
-
-        # Model 1: LightGBM
-        model_lgbm = lgb.LGBMClassifier(
-            n_estimators=2000,
-            random_state=42 + fold,
-            n_jobs=-1,
-            verbose=-1,
-            **lgbm_params,
+        encode_categories(X_tr, global_cats)
+        encode_categories(X_va, global_cats)
+
+        spw = positive_class_weight(y_tr)
+        X_tr_f = model_input(X_tr[features])
+        X_va_f = model_input(X_va[features])
+        X_te_f = model_input(
+            np.column_stack([X_te_base, X_te_cols[te_names].to_numpy()])
         )
-        model_lgbm.fit(
-            X_tr_res,
-            y_tr_res,
-            eval_set=[(X_va[features], y_va)],
-            callbacks=[lgb.early_stopping(150, verbose=False)],
-        )
-        oof_lgbm[val_idx] = model_lgbm.predict_proba(X_va[features])[:, 1]
-        test_lgbm += model_lgbm.predict_proba(X_te[features])[:, 1] / n_splits
 
-        # Model 2: XGBoost
-        model_xgb = xgb.XGBClassifier(
-            n_estimators=2000,
-            learning_rate=lgbm_params["learning_rate"],
-            max_depth=lgbm_params["max_depth"],
-            subsample=lgbm_params["subsample"],
-            colsample_bytree=lgbm_params["colsample_bytree"],
-            reg_alpha=lgbm_params["reg_alpha"],
-            reg_lambda=lgbm_params["reg_lambda"],
-            random_state=42 + fold,
-            n_jobs=-1,
-            eval_metric="logloss",
-        )
-        model_xgb.fit(
-            X_tr_res, y_tr_res, eval_set=[(X_va[features], y_va)], verbose=False
+        # Base models are independent, so train them in parallel
+        results = Parallel(n_jobs=3, backend="loky")(
+            delayed(_fit_predict)(
+                kind,
+                X_tr_f,
+                y_tr,
+                X_va_f,
+                y_va,
+                X_te_f,
+                spw,
+                42 + fold,
+                lgbm_params,
+                catboost_params,
+            )
+            for kind in ["lgbm", "xgb", "cat"]
         )
-        oof_xgb[val_idx] = model_xgb.predict_proba(X_va[features])[:, 1]
-        test_xgb += model_xgb.predict_proba(X_te[features])[:, 1] / n_splits
+        (va_lgbm, te_lgbm), (va_xgb, te_xgb), (va_cat, te_cat) = results
 
-        # Model 3: CatBoost (with optimized params)
-        model_cat = CatBoostClassifier(
-            iterations=2000, random_state=42 + fold, verbose=0, **catboost_params
-        )
-        model_cat.fit(
-            X_tr_res,
-            y_tr_res,
-            eval_set=(X_va[features], y_va),
-            early_stopping_rounds=150,
-            verbose=False,
-        )
-        oof_cat[val_idx] = model_cat.predict_proba(X_va[features])[:, 1]
-        test_cat += model_cat.predict_proba(X_te[features])[:, 1] / n_splits
+        oof_lgbm[val_idx] = va_lgbm
+        oof_xgb[val_idx] = va_xgb
+        oof_cat[val_idx] = va_cat
+        test_lgbm += te_lgbm / n_splits
+        test_xgb += te_xgb / n_splits
+        test_cat += te_cat / n_splits
 
     # Calculate individual OOF F1 scores
     f1_lgbm = max(
@@ -723,12 +992,11 @@ def train_weighted_ensemble(
     return oof_weighted, test_weighted, best_thr, (w_lgbm, w_xgb, w_cat)
 
 
-# Main Execution Pipeline
-def main():
+# Data Preparation
+def prepare_features():
     """
-    Main execution function for the modeling pipeline.
+    Load data from DB, split train/test and run feature engineering.
     """
-
     # Load and merge all data from DB
     df = load_data()
 
@@ -760,6 +1028,31 @@ def main():
     print("\nCreating enhanced features...")
     X, artifacts = create_enhanced_features_v2(X_raw)
     X_test = create_enhanced_features_v2(X_test_raw, artifacts=artifacts)
+
+    return X, y, X_test, test_ids, artifacts
+
+
+# Main Execution Pipeline
+def main():
+    """
+    Main execution function for the modeling pipeline.
+    """
+
+    if USE_FEATURE_CACHE:
+        key = feature_cache_key(data_fingerprint())
+        cached = load_feature_cache(key)
+    else:
+        print("USE_FEATURE_CACHE=0: rebuilding features without the cache")
+        key, cached = None, None
+
+    if cached is not None:
+        print(f"Loading cached features from {CACHE_DIR} (key={key})...")
+        X, y, X_test, test_ids, artifacts = cached
+    else:
+        X, y, X_test, test_ids, artifacts = prepare_features()
+        if key is not None:
+            save_feature_cache(key, X, y, X_test, test_ids, artifacts)
+
     print(f"Features created: {X.shape[1]}")
     print(f"Using SHAP-selected features: {len(SELECTED_FEATURES)}")
 
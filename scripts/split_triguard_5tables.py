@@ -1,24 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import pandas as pd
+import polars as pl
 
 IN_PATH = "Training_TriGuard.csv"
 OUT_DIR = Path("tri_guard_5_py_clean")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 
-df_raw = pd.read_csv(IN_PATH, dtype=str, keep_default_na=False)
+# Lazy scan: every column as a non-null string, whitespace stripped.
+# Nothing is materialized until the final collect_all.
+lf_raw = pl.scan_csv(IN_PATH, infer_schema=False)
 
 
-def strip_df(df):
-    return df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+def strip_df(lf):
+    return lf.with_columns(pl.all().str.strip_chars().fill_null(""))
 
 
-df = strip_df(df_raw.copy())
+df = strip_df(lf_raw)
+df_columns = frozenset(df.collect_schema().names())
 
 
 def pick(*names):
-    return [c for c in names if c in df.columns]
+    return [c for c in dict.fromkeys(names) if c in df_columns]
 
 
 claim_keep = pick(
@@ -55,21 +59,30 @@ veh_cols = pick(
 )
 acc_cols = pick("accident_site", "accident_type")
 
-if "claim_number" in df.columns and "claim_number" not in claim_keep:
+if "claim_number" in df_columns and "claim_number" not in claim_keep:
     claim_keep = ["claim_number"] + claim_keep
 
 if "zip_code" in claim_keep and "zip" in claim_keep:
     claim_keep.remove("zip")
 
 
+def key_hash(cols):
+    # One u64 per row over the multi-column string key
+    return pl.struct(cols).hash().alias("__h")
+
+
 def build_dim(cols, key):
     if not cols:
-        return pd.DataFrame(columns=[key])
-    dim = df[cols].copy()
-    mask_all_empty = dim.apply(lambda r: all((v == "" for v in r)), axis=1)
-    dim = dim[~mask_all_empty].drop_duplicates().reset_index(drop=True)
-    dim[key] = range(1, len(dim) + 1)
-    return dim
+        return pl.LazyFrame(schema={key: pl.Int64})
+    # Dedupe on the single u64 row hash rather than comparing every string
+    # column; first occurrence wins, so keys follow source order as before
+    return (
+        df.select(cols)
+        .filter(~pl.all_horizontal(pl.col(cols) == ""))
+        .filter(key_hash(cols).is_first_distinct())
+        .with_row_index(key, offset=1)
+        .select(cols + [pl.col(key).cast(pl.Int64)])
+    )
 
 
 Driver = build_dim(driver_cols, "driver_key")
@@ -80,39 +93,68 @@ Accident = build_dim(acc_cols, "accident_key")
 
 join_cols = list(dict.fromkeys(driver_cols + policy_cols + veh_cols + acc_cols))
 claim_cols_full = list(dict.fromkeys(claim_keep + join_cols))
-Claim = (
-    df[claim_cols_full].drop_duplicates(subset=["claim_number"])
-    if "claim_number" in claim_cols_full
-    else df[claim_cols_full]
-).copy()
+Claim = df.select(claim_cols_full)
+if "claim_number" in claim_cols_full:
+    Claim = Claim.unique(subset=["claim_number"], keep="first", maintain_order=True)
 
 
-def left_merge_key(base, dim, on_cols):
+def left_merge_key(base, dim, on_cols, key):
+    # Join on a single integer hash of the key columns instead of hashing
+    # several string columns; the attribute columns are then dropped since
+    # they are only needed as join keys.
+    if not on_cols:
+        return base
     return (
-        base.merge(dim, on=on_cols, how="left") if on_cols and not dim.empty else base
+        base.with_columns(key_hash(on_cols))
+        .join(
+            dim.select(key_hash(on_cols), key),
+            on="__h",
+            how="left",
+            maintain_order="left",
+        )
+        .drop(["__h"] + [c for c in on_cols if c not in claim_keep])
     )
 
 
-Claim = left_merge_key(Claim, Accident, acc_cols)
-Claim = left_merge_key(Claim, Policyholder, policy_cols)
-Claim = left_merge_key(Claim, Vehicle, veh_cols)
-Claim = left_merge_key(Claim, Driver, driver_cols)
+# One lazy plan: the four joins are chained and executed in a single pass
+for dim, on_cols, key in [
+    (Accident, acc_cols, "accident_key"),
+    (Policyholder, policy_cols, "policyholder_key"),
+    (Vehicle, veh_cols, "vehicle_key"),
+    (Driver, driver_cols, "driver_key"),
+]:
+    Claim = left_merge_key(Claim, dim, on_cols, key)
 
 
-final_cols = [c for c in claim_keep if c in Claim.columns] + [
+claim_columns = Claim.collect_schema().names()
+final_cols = [c for c in claim_keep if c in claim_columns] + [
     c
     for c in ["accident_key", "policyholder_key", "vehicle_key", "driver_key"]
-    if c in Claim.columns
+    if c in claim_columns
 ]
-Claim = Claim[final_cols].copy()
+Claim = Claim.select(final_cols)
 
 
-def save_csv(df_, name):
-    df_.to_csv(OUT_DIR / f"{name}.csv", index=False)
+# Run the whole plan at once so the shared scan/strip is computed once
+Accident, Policyholder, Vehicle, Driver, Claim = pl.collect_all(
+    [Accident, Policyholder, Vehicle, Driver, Claim], engine="streaming"
+)
 
 
-save_csv(Accident, "Accident")
-save_csv(Policyholder, "Policyholder")
-save_csv(Vehicle, "Vehicle")
-save_csv(Driver, "Driver")
-save_csv(Claim, "Claim")
+def save_csv(df_, name):
+    df_.write_csv(OUT_DIR / f"{name}.csv")
+
+
+# The Airflow DAG, analysis scripts and notebooks all read these CSVs.
+# Polars releases the GIL while writing, so the five tables are written
+# concurrently.
+tables = [
+    (Accident, "Accident"),
+    (Policyholder, "Policyholder"),
+    (Vehicle, "Vehicle"),
+    (Driver, "Driver"),
+    (Claim, "Claim"),
+]
+with ThreadPoolExecutor(max_workers=len(tables)) as ex:
+    # list() so an exception in any writer is raised here
+    list(ex.map(lambda t: save_csv(*t), tables))
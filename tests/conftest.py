@@ -2,29 +2,48 @@
 Pytest configuration and fixtures for the test suite
 """
 
+import hashlib
+import inspect
+import os
+import sys
 import tempfile
 from pathlib import Path
+from types import SimpleNamespace
 
 import numpy as np
 import pandas as pd
 import polars as pl
+import pyarrow as pa
 import pytest
 
+# Make the repo root importable once for every test module (and every xdist
+# worker) so `scripts.modeling` resolves without per-module path setup
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
-@pytest.fixture
+
+@pytest.fixture(scope="session")
+def modeling_mod():
+    """Fixture providing the scripts.modeling module"""
+    # Imported here so the ML stack only loads for tests that use it
+    from scripts import modeling
+
+    return modeling
+
+
+@pytest.fixture(scope="session")
 def sample_data_dir():
     """Fixture providing path to sample data directory"""
     return Path(__file__).parent.parent / "data" / "tri_guard_5_py_clean"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_claim_data():
     """Fixture providing sample claim data as pandas DataFrame"""
     np.random.seed(42)
     n = 100
 
     data = {
-        "claim_number": [f"CLM{i:05d}" for i in range(n)],
+        "claim_number": np.char.add("CLM", np.char.zfill(np.arange(n).astype(str), 5)),
         "claim_date": pd.date_range("2016-01-01", periods=n, freq="D"),
         "accident_key": np.random.randint(1, 13, n),
         "policyholder_key": np.random.randint(1, 100, n),
@@ -39,10 +58,16 @@ def sample_claim_data():
         "channel": np.random.choice(["Broker", "Phone", "Online"], n),
     }
 
-    return pd.DataFrame(data)
+    df = pd.DataFrame(data)
+    # Arrow-backed strings: isin() runs in Arrow's is_in kernel. large_string
+    # rather than dictionary so .str still works and it round-trips via parquet
+    df["witness_present_ind"] = df["witness_present_ind"].astype(
+        pd.ArrowDtype(pa.large_string())
+    )
+    return df
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_polars_claim_data():
     """Fixture providing sample claim data as Polars DataFrame"""
     np.random.seed(42)
@@ -50,7 +75,9 @@ def sample_polars_claim_data():
 
     return pl.DataFrame(
         {
-            "claim_number": [f"CLM{i:05d}" for i in range(n)],
+            "claim_number": np.char.add(
+                "CLM", np.char.zfill(np.arange(n).astype(str), 5)
+            ),
             "accident_key": np.random.randint(1, 13, n),
             "subrogation": np.random.choice([0, 1], n, p=[0.75, 0.25]),
             "claim_est_payout": np.random.uniform(1000, 25000, n),
@@ -63,68 +90,140 @@ def sample_polars_claim_data():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_accident_data():
     """Fixture providing sample accident data"""
+    rng = np.random.default_rng(1)
     return pd.DataFrame(
         {
             "accident_key": range(1, 13),
-            "accident_type": np.random.choice(
+            "accident_type": rng.choice(
                 ["single_car", "multi_vehicle_clear", "multi_vehicle_unclear"], 12
             ),
-            "accident_site": np.random.choice(
+            "accident_site": rng.choice(
                 ["Highway", "Intersection", "Parking Area", "Local"], 12
             ),
         }
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_driver_data():
     """Fixture providing sample driver data"""
+    rng = np.random.default_rng(2)
     return pd.DataFrame(
         {
             "driver_key": range(1, 101),
-            "year_of_born": np.random.randint(1950, 2000, 100),
-            "age_of_DL": np.random.randint(16, 25, 100),
-            "gender": np.random.choice(["M", "F"], 100),
-            "safety_rating": np.random.uniform(50, 100, 100),
+            "year_of_born": rng.integers(1950, 2000, 100),
+            "age_of_DL": rng.integers(16, 25, 100),
+            "gender": rng.choice(["M", "F"], 100),
+            "safety_rating": rng.uniform(50, 100, 100),
         }
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_vehicle_data():
     """Fixture providing sample vehicle data"""
+    rng = np.random.default_rng(3)
     return pd.DataFrame(
         {
             "vehicle_key": range(1, 101),
-            "vehicle_price": np.random.uniform(15000, 50000, 100),
-            "vehicle_mileage": np.random.uniform(0, 150000, 100),
-            "vehicle_weight": np.random.uniform(2500, 5000, 100),
-            "vehicle_category": np.random.choice(["Compact", "Medium", "Large"], 100),
-            "vehicle_color": np.random.choice(["silver", "black", "red", "white"], 100),
-            "vehicle_made_year": np.random.randint(2000, 2017, 100),
+            "vehicle_price": rng.uniform(15000, 50000, 100),
+            "vehicle_mileage": rng.uniform(0, 150000, 100),
+            "vehicle_weight": rng.uniform(2500, 5000, 100),
+            "vehicle_category": rng.choice(["Compact", "Medium", "Large"], 100),
+            "vehicle_color": rng.choice(["silver", "black", "red", "white"], 100),
+            "vehicle_made_year": rng.integers(2000, 2017, 100),
         }
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_policyholder_data():
     """Fixture providing sample policyholder data"""
+    rng = np.random.default_rng(4)
     return pd.DataFrame(
         {
             "policyholder_key": range(1, 101),
-            "annual_income": np.random.uniform(20000, 150000, 100),
-            "past_num_of_claims": np.random.randint(0, 10, 100),
-            "high_education_ind": np.random.choice([0, 1], 100),
-            "address_change_ind": np.random.choice([0, 1], 100),
-            "living_status": np.random.choice(["Own", "Rent"], 100),
-            "zip_code": [str(np.random.randint(10000, 99999)) for _ in range(100)],
+            "annual_income": rng.uniform(20000, 150000, 100),
+            "past_num_of_claims": rng.integers(0, 10, 100),
+            "high_education_ind": rng.choice([0, 1], 100),
+            "address_change_ind": rng.choice([0, 1], 100),
+            "living_status": rng.choice(["Own", "Rent"], 100),
+            "zip_code": rng.integers(10000, 99999, 100).astype("<U5"),
         }
     )
 
 
+@pytest.fixture(scope="session")
+def merged_all(
+    sample_claim_data,
+    sample_accident_data,
+    sample_driver_data,
+    sample_vehicle_data,
+    sample_policyholder_data,
+):
+    """Fixture providing the claim table left-merged with all four dims (built once)"""
+    # Each dim is indexed by its integer key and aligned to the claim rows with
+    # one reindex; a single concat then builds the output, with no intermediate
+    # merged frames. Same rows/columns as the chained left merges.
+    dims = [
+        ("accident_key", sample_accident_data),
+        ("policyholder_key", sample_policyholder_data),
+        ("vehicle_key", sample_vehicle_data),
+        ("driver_key", sample_driver_data),
+    ]
+    aligned = [
+        dim.set_index(key).reindex(sample_claim_data[key].to_numpy())
+        for key, dim in dims
+    ]
+    for part in aligned:
+        part.index = sample_claim_data.index
+    return pd.concat([sample_claim_data, *aligned], axis=1)
+
+
+@pytest.fixture(scope="session")
+def merged_features_artifacts(modeling_mod, merged_all, tmp_path_factory):
+    """Fixture providing (features, artifacts) for merged_all, built once"""
+    if not os.environ.get("PYTEST_XDIST_WORKER"):
+        return modeling_mod.create_enhanced_features_v2(merged_all.copy())
+
+    # Under pytest-xdist the first worker builds the features and pickles
+    # them into the run's shared temp dir; the others just load that file.
+    # Pickle (not parquet) so dtypes and the artifacts dict round-trip as-is.
+    # The file is keyed on merged_all and the FE source, so a worker only
+    # reuses features built from the same input and code.
+    from filelock import FileLock
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(pd.util.hash_pandas_object(merged_all).to_numpy().tobytes())
+    digest.update(inspect.getsource(modeling_mod.create_enhanced_features_v2).encode())
+    shared_dir = tmp_path_factory.getbasetemp().parent
+    path = shared_dir / f"engineered_{digest.hexdigest()}.pkl"
+    with FileLock(str(path) + ".lock"):
+        if path.is_file():
+            return pd.read_pickle(path)
+        features = modeling_mod.create_enhanced_features_v2(merged_all.copy())
+        pd.to_pickle(features, path)
+    return features
+
+
+@pytest.fixture(scope="session")
+def engineered_pipeline_result(merged_features_artifacts):
+    """Fixture providing the engineered frame plus its numeric columns/block"""
+    result, artifacts = merged_features_artifacts
+    # select_dtypes and the column set are built once here, not per test
+    numeric = result.select_dtypes(include=[np.number])
+    return SimpleNamespace(
+        df=result,
+        artifacts=artifacts,
+        columns=frozenset(result.columns),
+        numeric_cols=numeric.columns,
+        numeric_block=numeric.to_numpy(copy=False),
+    )
+
+
 @pytest.fixture
 def temp_csv_dir():
     """Fixture providing temporary directory for CSV files"""
@@ -143,11 +242,13 @@ def mock_db_environment(monkeypatch):
     monkeypatch.setenv("PGSSLMODE", "disable")
 
 
-@pytest.fixture
-def sample_image_paths(tmp_path):
-    """Fixture providing paths to sample image files"""
+@pytest.fixture(scope="session")
+def sample_image_paths(tmp_path_factory):
+    """Fixture providing paths to sample image files (created once per session)"""
     from PIL import Image
 
+    tmp_path = tmp_path_factory.mktemp("imgs")
+
     # Create sample PNG
     png_path = tmp_path / "test_image.png"
     img = Image.new("RGB", (100, 100), color="red")
@@ -159,3 +260,21 @@ def sample_image_paths(tmp_path):
     img.save(jpg_path)
 
     return {"png": png_path, "jpg": jpg_path, "dir": tmp_path}
+
+
+@pytest.fixture(scope="session")
+def sample_image_meta(sample_image_paths):
+    """Fixture providing size/format/mode/file size of each sample image"""
+    from PIL import Image
+
+    meta = {}
+    for kind, fmt in (("png", "PNG"), ("jpg", "JPEG")):
+        path = sample_image_paths[kind]
+        with Image.open(path, formats=(fmt,)) as img:
+            meta[kind] = SimpleNamespace(
+                size=img.size,
+                format=img.format,
+                mode=img.mode,
+                file_size=os.path.getsize(path),
+            )
+    return meta
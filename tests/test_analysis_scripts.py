@@ -135,20 +135,29 @@ class TestLingyueVehicleAnalysis:
         df = pl.DataFrame({"witness": ["Y", "N", "yes", "no", "1", "0"]})
 
         def to_bool(col: pl.Expr) -> pl.Expr:
+            bool_map = {
+                "y": 1,
+                "yes": 1,
+                "true": 1,
+                "1": 1,
+                "n": 0,
+                "no": 0,
+                "false": 0,
+                "0": 0,
+            }
             s = col.cast(pl.Utf8, strict=False).str.strip_chars().str.to_lowercase()
-            return (
-                pl.when(s.is_in(["y", "yes", "true", "1"]))
-                .then(pl.lit(1))
-                .when(s.is_in(["n", "no", "false", "0"]))
-                .then(pl.lit(0))
-                .otherwise(None)
-            )
+            return s.replace_strict(bool_map, default=None, return_dtype=pl.Int8)
 
         result = df.with_columns([to_bool(pl.col("witness")).alias("witness_bool")])
 
         assert result["witness_bool"][0] == 1  # 'Y'
         assert result["witness_bool"][1] == 0  # 'N'
         assert result["witness_bool"][2] == 1  # 'yes'
+        assert result["witness_bool"][5] == 0  # '0'
+
+        unknown = pl.DataFrame({"witness": [" Y ", "maybe", None]})
+        out = unknown.select(to_bool(pl.col("witness")))["witness"].to_list()
+        assert out == [1, None, None]
 
     def test_vehicle_data_merge(self):
         """Test vehicle data merging"""
@@ -171,6 +180,8 @@ class TestLingyueVehicleAnalysis:
         merged = claim.join(vehicle, on="vehicle_key", how="inner")
 
         assert merged.height == 3
+        assert merged["vehicle_category"].to_list() == ["Compact", "Large", "Compact"]
+        assert merged["vehicle_price"].dtype == pl.Float64
         assert "vehicle_category" in merged.columns
         assert "vehicle_price" in merged.columns
 
@@ -246,6 +257,7 @@ class TestBruceDriverAnalysis:
 
         assert df_cat["safety_category"][0] == "Low"  # 50
         assert df_cat["safety_category"][2] == "High"  # 90
+        assert df_cat["safety_category"][3] == "Medium"  # 60
 
 
 class TestAnalysisOutputs:
@@ -2,47 +2,50 @@
 Tests for the modeling.py script
 """
 
-import sys
-from pathlib import Path
+import hashlib
+import inspect
 
+import numpy as np
 import pandas as pd
 
 from scripts.modeling import (
     SELECTED_FEATURES,
+    SELECTED_FEATURES_SET,
+    category_indexes,
     create_enhanced_features_v2,
+    encode_categories,
+    feature_cache_key,
+    load_data,
+    load_feature_cache,
+    positive_class_weight,
+    prepare_features,
+    save_feature_cache,
     target_encode,
 )
 
-# Add scripts directory to path
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+def _fingerprint(df):
+    """SHA-256 over the numeric block's buffer plus the row hashes of the rest"""
+    num = df.select_dtypes("number")
+    h = hashlib.sha256(np.ascontiguousarray(num.to_numpy()).tobytes())
+    rest = df.drop(columns=num.columns)
+    h.update(pd.util.hash_pandas_object(rest, index=False).to_numpy().tobytes())
+    return h.digest()
 
 
 class TestFeatureEngineering:
     """Test suite for feature engineering functions"""
 
     def test_create_enhanced_features_v2_basic(
-        self,
-        sample_claim_data,
-        sample_accident_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
+        self, merged_all, merged_features_artifacts
     ):
         """Test basic feature engineering functionality"""
-        # Merge all data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
         # Test training mode (returns tuple)
-        result, artifacts = create_enhanced_features_v2(df)
+        result, artifacts = merged_features_artifacts
 
         assert isinstance(result, pd.DataFrame)
         assert isinstance(artifacts, dict)
-        assert len(result) == len(df)
+        assert len(result) == len(merged_all)
         assert "age_at_claim" in result.columns
         assert "period_of_driving" in result.columns
         assert "liab_prct" in result.columns
@@ -52,49 +55,21 @@ class TestFeatureEngineering:
         assert "annual_income_med" in artifacts
 
     def test_create_enhanced_features_v2_inference(
-        self,
-        sample_claim_data,
-        sample_accident_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
+        self, merged_all, merged_features_artifacts
     ):
         """Test feature engineering in inference mode"""
-        # Merge all data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
         # First pass: training
-        _, artifacts = create_enhanced_features_v2(df.copy())
+        _, artifacts = merged_features_artifacts
 
         # Second pass: inference
-        result_inference = create_enhanced_features_v2(df.copy(), artifacts=artifacts)
+        result_inference = create_enhanced_features_v2(merged_all, artifacts=artifacts)
 
         assert isinstance(result_inference, pd.DataFrame)
-        assert len(result_inference) == len(df)
-
-    def test_time_features(
-        self,
-        sample_claim_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
-        sample_accident_data,
-    ):
-        """Test time-based feature creation"""
-        # Merge all required data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
+        assert len(result_inference) == len(merged_all)
 
-        result, _ = create_enhanced_features_v2(df)
+    def test_time_features(self, merged_features_artifacts):
+        """Test time-based feature creation"""
+        result, _ = merged_features_artifacts
 
         # Check time features exist
         assert "claim_year" in result.columns
@@ -106,24 +81,9 @@ class TestFeatureEngineering:
         # Check weekend flag logic
         assert result["is_weekend"].isin([0, 1]).all()
 
-    def test_liability_features(
-        self,
-        sample_claim_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
-        sample_accident_data,
-    ):
+    def test_liability_features(self, merged_features_artifacts):
         """Test liability-based feature engineering"""
-        # Merge all required data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
-        result, _ = create_enhanced_features_v2(df)
+        result, _ = merged_features_artifacts
 
         # Check liability features
         assert "liab_squared" in result.columns
@@ -137,143 +97,79 @@ class TestFeatureEngineering:
         assert "liab_0_10" in result.columns
         assert "liab_20_30" in result.columns
 
-    def test_interaction_features(
-        self,
-        sample_claim_data,
-        sample_accident_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
-    ):
+    def test_interaction_features(self, merged_features_artifacts):
         """Test interaction feature creation"""
-        # Merge all required data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
-        result, _ = create_enhanced_features_v2(df)
+        result, _ = merged_features_artifacts
 
         # Check key interactions
         assert "liab_x_witness" in result.columns
         assert "liab_x_police" in result.columns
         assert "golden_combo" in result.columns
 
+    def test_zip3_feature(self, merged_all):
+        """Test zip3 prefix extraction"""
+        df = merged_all.copy()
+        df.loc[0, "zip_code"] = None
+        df.loc[1, "zip_code"] = "02134"
+
+        result, _ = create_enhanced_features_v2(df)
+
+        assert result.loc[0, "zip3"] == "unknown"
+        # Zero-padded like the Airflow DAG's zip_code.str[:3]
+        assert result.loc[1, "zip3"] == "021"
+        expected = df.loc[1:, "zip_code"].astype(int).astype(str).str.zfill(5).str[:3]
+        assert result.loc[1:, "zip3"].tolist() == expected.tolist()
+
     def test_missing_value_handling(
         self, sample_driver_data, sample_vehicle_data, sample_policyholder_data
     ):
         """Test handling of missing values"""
-        df = pd.DataFrame(
+        nan = np.nan
+
+        def f32(*values):
+            return np.array(values, dtype=np.float32)
+
+        # Typed columns up front: float32 with NaN for numerics, categoricals
+        # for the flag strings, so no object-dtype inference is needed
+        df10 = pd.DataFrame(
             {
                 "claim_date": pd.date_range("2016-01-01", periods=10),
-                "year_of_born": [
-                    1980,
-                    None,
-                    1990,
-                    None,
-                    1985,
-                    1975,
-                    None,
-                    1995,
-                    1988,
-                    None,
-                ],
-                "age_of_DL": [20, 25, None, 22, None, 18, 23, None, 21, 24],
-                "vehicle_mileage": [
-                    50000,
-                    None,
-                    75000,
-                    None,
-                    100000,
-                    None,
-                    25000,
-                    None,
-                    60000,
-                    80000,
-                ],
-                "annual_income": [
-                    50000,
-                    None,
-                    75000,
-                    None,
-                    None,
-                    60000,
-                    None,
-                    85000,
-                    None,
-                    70000,
-                ],
-                "vehicle_price": [
-                    20000,
-                    None,
-                    30000,
-                    None,
-                    25000,
-                    None,
-                    35000,
-                    None,
-                    28000,
-                    None,
-                ],
-                "vehicle_weight": [
-                    3000,
-                    None,
-                    3500,
-                    None,
-                    None,
-                    3200,
-                    None,
-                    3800,
-                    None,
-                    3400,
-                ],
-                "claim_est_payout": [
-                    5000,
-                    None,
-                    7500,
-                    None,
-                    None,
-                    6000,
-                    None,
-                    8500,
-                    None,
-                    7000,
-                ],
-                "liab_prct": [30, None, 50, None, 25, None, 75, None, 40, None],
-                "witness_present_ind": [
-                    "Y",
-                    "N",
-                    None,
-                    "Y",
-                    "N",
-                    None,
-                    "Y",
-                    "N",
-                    None,
-                    "Y",
-                ],
-                "policy_report_filed_ind": [1, 0, None, 1, None, 0, 1, None, 0, 1],
-                "in_network_bodyshop": [
-                    "yes",
-                    "no",
-                    None,
-                    "yes",
-                    None,
-                    "no",
-                    "yes",
-                    None,
-                    "no",
-                    "yes",
-                ],
-                "past_num_of_claims": [0, None, 1, None, 2, None, 0, None, 1, None],
+                "year_of_born": f32(
+                    1980, nan, 1990, nan, 1985, 1975, nan, 1995, 1988, nan
+                ),
+                "age_of_DL": f32(20, 25, nan, 22, nan, 18, 23, nan, 21, 24),
+                "vehicle_mileage": f32(
+                    50000, nan, 75000, nan, 100000, nan, 25000, nan, 60000, 80000
+                ),
+                "annual_income": f32(
+                    50000, nan, 75000, nan, nan, 60000, nan, 85000, nan, 70000
+                ),
+                "vehicle_price": f32(
+                    20000, nan, 30000, nan, 25000, nan, 35000, nan, 28000, nan
+                ),
+                "vehicle_weight": f32(
+                    3000, nan, 3500, nan, nan, 3200, nan, 3800, nan, 3400
+                ),
+                "claim_est_payout": f32(
+                    5000, nan, 7500, nan, nan, 6000, nan, 8500, nan, 7000
+                ),
+                "liab_prct": f32(30, nan, 50, nan, 25, nan, 75, nan, 40, nan),
+                "witness_present_ind": pd.Categorical(
+                    ["Y", "N", None, "Y", "N", None, "Y", "N", None, "Y"],
+                    categories=["Y", "N"],
+                ),
+                "policy_report_filed_ind": f32(1, 0, nan, 1, nan, 0, 1, nan, 0, 1),
+                "in_network_bodyshop": pd.Categorical(
+                    ["yes", "no", None, "yes", None, "no", "yes", None, "no", "yes"],
+                    categories=["yes", "no"],
+                ),
+                "past_num_of_claims": f32(0, nan, 1, nan, 2, nan, 0, nan, 1, nan),
                 # ADDED
-                "high_education_ind": [1, 0, None, 1, None, 0, 1, None, 0, 1],
+                "high_education_ind": f32(1, 0, nan, 1, nan, 0, 1, nan, 0, 1),
                 # ADDED
-                "address_change_ind": [0, 1, None, 0, None, 1, 0, None, 1, 0],
+                "address_change_ind": f32(0, 1, nan, 0, nan, 1, 0, nan, 1, 0),
                 # ADDED
-                "safety_rating": [70, None, 80, None, 75, None, 85, None, 90, None],
+                "safety_rating": f32(70, nan, 80, nan, 75, nan, 85, nan, 90, nan),
                 "accident_type": ["single_car"] * 10,
                 "accident_site": ["Highway"] * 10,
                 "gender": ["M"] * 10,
@@ -283,8 +179,14 @@ class TestFeatureEngineering:
             }
         )
 
+        # Tile the missing pattern to 10k rows so the vectorized paths, not
+        # fixed per-call overhead, dominate
+        df = pd.concat([df10] * 1000, ignore_index=True)
+
         result, artifacts = create_enhanced_features_v2(df)
 
+        assert len(result) == 10_000
+
         # Check no NaN in critical features
         assert not result["age_at_claim"].isna().any()
         assert not result["period_of_driving"].isna().any()
@@ -296,11 +198,13 @@ class TestTargetEncoding:
 
     def test_target_encode_unseen_categories(self):
         """Test target encoding with unseen categories"""
-        X_train = pd.DataFrame({"cat": ["A", "B", "A", "B"]})
+        # Shared categories: target_encode takes the int codes directly
+        cats = pd.Index(["A", "B", "C", "D"])
+        X_train = pd.DataFrame({"cat": pd.Categorical(["A", "B", "A", "B"], cats)})
         y_train = pd.Series([1, 0, 1, 0])
 
-        X_val = pd.DataFrame({"cat": ["C", "D"]})  # Unseen categories
-        X_test = pd.DataFrame({"cat": ["C"]})
+        X_val = pd.DataFrame({"cat": pd.Categorical(["C", "D"], cats)})  # Unseen
+        X_test = pd.DataFrame({"cat": pd.Categorical(["C"], cats)})
 
         te_names = target_encode(X_train, y_train, X_val, X_test, ["cat"])
 
@@ -312,6 +216,129 @@ class TestTargetEncoding:
         assert "cat_te" in X_test.columns
         assert not X_test["cat_te"].isna().any()
 
+    def test_target_encode_categorical_matches_object(self):
+        """Test the categorical-code path gives the same encoding as strings"""
+        cases = [
+            (
+                [1, 0, 1, 1, 0],
+                {
+                    "train": ["A", "B", "A", "C", None],
+                    "val": ["C", "D", None],
+                    "test": ["B", "A"],
+                },
+                ["A", "B", "C", "D"],
+            ),
+            # All-missing column: no categories, everything gets the global mean
+            ([1, 0], {"train": [None, None], "val": [None], "test": [None]}, []),
+        ]
+        for y, frames, categories in cases:
+            y_train = pd.Series(y)
+            obj = {k: pd.DataFrame({"cat": v}) for k, v in frames.items()}
+            cat = {
+                k: pd.DataFrame({"cat": pd.Categorical(v, categories=categories)})
+                for k, v in frames.items()
+            }
+
+            target_encode(obj["train"], y_train, obj["val"], obj["test"], ["cat"])
+            target_encode(cat["train"], y_train, cat["val"], cat["test"], ["cat"])
+
+            for k in frames:
+                np.testing.assert_allclose(cat[k]["cat_te"], obj[k]["cat_te"])
+
+
+class TestCategoryEncoding:
+    """Test suite for shared categorical codes"""
+
+    def test_codes_shared_across_frames(self):
+        """Test that train and test frames get the same codes"""
+        X_train = pd.DataFrame({"cat": ["b", "a", "b"], "num": [1, 2, 3]})
+        X_test = pd.DataFrame({"cat": ["c", "a"], "num": [4, 5]})
+
+        global_cats = category_indexes([X_train, X_test], ["cat", "num"])
+
+        # Only object columns are encoded
+        assert list(global_cats) == ["cat"]
+
+        encode_categories(X_train, global_cats)
+        encode_categories(X_test, global_cats)
+
+        # Sorted like LabelEncoder: a=0, b=1, c=2
+        assert X_train["cat"].tolist() == [1, 0, 1]
+        assert X_test["cat"].tolist() == [2, 0]
+
+
+class TestClassWeighting:
+    """Test suite for class imbalance weighting"""
+
+    def test_positive_class_weight_matches_smote_ratio(self):
+        """Test weight mirrors SMOTE(sampling_strategy=0.5)"""
+        y = pd.Series([0] * 80 + [1] * 20)
+
+        # 80 negatives / 20 positives * 0.5
+        assert positive_class_weight(y) == 2.0
+
+    def test_positive_class_weight_no_positives(self):
+        """Test weight does not divide by zero without positives"""
+        y = pd.Series([0, 0, 0])
+
+        assert positive_class_weight(y) == 1.5
+
+
+class TestFeatureCache:
+    """Test suite for the Parquet feature cache"""
+
+    def test_cache_key_tracks_hashed_sources(self, monkeypatch, modeling_mod):
+        """Test that editing any hashed function changes the cache key"""
+        base = feature_cache_key()
+        getsource = inspect.getsource
+
+        for fn in (load_data, prepare_features, create_enhanced_features_v2):
+            monkeypatch.setattr(
+                inspect,
+                "getsource",
+                lambda obj, fn=fn: getsource(obj) + ("# edit" if obj is fn else ""),
+            )
+            assert feature_cache_key() != base
+        monkeypatch.setattr(inspect, "getsource", getsource)
+        assert feature_cache_key() == base
+
+        monkeypatch.setattr(
+            modeling_mod, "SELECTED_FEATURES", SELECTED_FEATURES + ["new_feature"]
+        )
+        assert feature_cache_key() != base
+
+    def test_cache_key_tracks_data_fingerprint(self):
+        """Test that a different stg data fingerprint changes the cache key"""
+        before = feature_cache_key("(18001, 12, '2016-12-31')")
+        after = feature_cache_key("(18500, 12, '2017-01-31')")
+        assert before != after
+        assert before == feature_cache_key("(18001, 12, '2016-12-31')")
+
+    def test_cache_miss_returns_none(self, tmp_path):
+        """Test that a missing cache returns None"""
+        assert load_feature_cache("missing", cache_dir=tmp_path) is None
+
+    def test_cache_round_trip(self, tmp_path, merged_all):
+        """Test that cached features are restored unchanged"""
+        df = merged_all.copy()
+        y = df.pop("subrogation").astype(int)
+        test_ids = df.pop("claim_number")
+
+        X, artifacts = create_enhanced_features_v2(df.iloc[:80])
+        X_test = create_enhanced_features_v2(df.iloc[80:], artifacts=artifacts)
+
+        save_feature_cache(
+            "k", X, y.iloc[:80], X_test, test_ids.iloc[80:], artifacts, tmp_path
+        )
+        X_c, y_c, X_test_c, ids_c, artifacts_c = load_feature_cache("k", tmp_path)
+        assert not list(tmp_path.glob("*.tmp"))
+
+        pd.testing.assert_frame_equal(X_c, X)
+        pd.testing.assert_frame_equal(X_test_c, X_test)
+        assert y_c.tolist() == y.iloc[:80].tolist()
+        assert ids_c.tolist() == test_ids.iloc[80:].tolist()
+        assert artifacts_c.keys() == artifacts.keys()
+
 
 class TestSelectedFeatures:
     """Test suite for SELECTED_FEATURES configuration"""
@@ -322,56 +349,27 @@ class TestSelectedFeatures:
         assert len(SELECTED_FEATURES) > 0
         assert "liab_prct" in SELECTED_FEATURES
         assert "is_single_car" in SELECTED_FEATURES
+        assert SELECTED_FEATURES_SET == frozenset(SELECTED_FEATURES)
 
-    def test_selected_features_in_engineered_data(
-        self,
-        sample_claim_data,
-        sample_accident_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
-    ):
+    def test_selected_features_in_engineered_data(self, merged_features_artifacts):
         """Test that selected features are present in engineered data"""
-        # Merge all data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
-        result, _ = create_enhanced_features_v2(df)
+        result, _ = merged_features_artifacts
 
         # Check that most selected features are present
-        available_features = [f for f in SELECTED_FEATURES if f in result.columns]
+        available_features = SELECTED_FEATURES_SET & set(result.columns)
 
         # At least 90% of selected features should be present
-        coverage = len(available_features) / len(SELECTED_FEATURES)
+        coverage = len(available_features) / len(SELECTED_FEATURES_SET)
         assert coverage > 0.9, f"Only {coverage:.1%} of selected features are present"
 
 
 class TestDataValidation:
     """Test suite for data validation"""
 
-    def test_no_data_leakage_training_to_test(
-        self,
-        sample_claim_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
-        sample_accident_data,
-    ):
+    def test_no_data_leakage_training_to_test(self, merged_all):
         """Ensure no data leakage from training to test"""
-        # Merge all data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
-        df_train = df.iloc[:80].copy()
-        df_test = df.iloc[80:].copy()
+        df_train = merged_all.iloc[:80].copy()
+        df_test = merged_all.iloc[80:].copy()
 
         # Train features
         result_train, artifacts = create_enhanced_features_v2(df_train)
@@ -386,25 +384,14 @@ class TestDataValidation:
         # This is a proxy test - in production, verify this more rigorously
         assert isinstance(result_test, pd.DataFrame)
 
-    def test_feature_consistency(
-        self,
-        sample_claim_data,
-        sample_accident_data,
-        sample_driver_data,
-        sample_vehicle_data,
-        sample_policyholder_data,
-    ):
+    def test_feature_consistency(self, merged_all, merged_features_artifacts):
         """Test that features are consistent across runs"""
-        # Merge all data
-        df = (
-            sample_claim_data.merge(sample_accident_data, on="accident_key", how="left")
-            .merge(sample_policyholder_data, on="policyholder_key", how="left")
-            .merge(sample_vehicle_data, on="vehicle_key", how="left")
-            .merge(sample_driver_data, on="driver_key", how="left")
-        )
-
-        result1, artifacts1 = create_enhanced_features_v2(df.copy())
-        result2, artifacts2 = create_enhanced_features_v2(df.copy())
-
-        # Features should be identical
-        pd.testing.assert_frame_equal(result1, result2)
+        result1, artifacts1 = merged_features_artifacts
+        result2, artifacts2 = create_enhanced_features_v2(merged_all.copy())
+
+        # Features should be identical: same layout, then one hash per frame
+        # instead of a column-by-column comparison
+        assert result1.columns.equals(result2.columns)
+        assert result1.index.equals(result2.index)
+        assert result1.dtypes.equals(result2.dtypes)
+        assert _fingerprint(result1) == _fingerprint(result2)